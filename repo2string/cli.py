@@ -2,14 +2,25 @@ import argparse
 import os
 import sys
 
-import pyperclip
-from pathspec import PathSpec
+# pathspec, pyperclip and the tokenizer are imported where they are used,
+# so that `r2s --daemon` only loads what it needs to talk to the daemon
 
-from repo2string.scan import DEFAULT_IGNORE_PATTERNS, count_tokens
+
+def __getattr__(name):
+    # Names this module used to import from repo2string.scan, resolved on first access
+    if name in ("DEFAULT_IGNORE_PATTERNS", "count_tokens"):
+        from repo2string import scan
+
+        return getattr(scan, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_files_content(path="."):
     """Get the contents of all tracked files in the repository."""
+    from pathspec import PathSpec
+
+    from repo2string.scan import DEFAULT_IGNORE_PATTERNS
+
     # Get absolute path
     abs_path = os.path.abspath(path)
 
@@ -63,8 +74,22 @@ def assemble_text(files_data):
     return "\n".join(parts)
 
 
-def run_cli(path, verbose=False):
+def run_cli(path, verbose=False, use_daemon=False):
     """Run in CLI mode"""
+    if use_daemon:
+        from repo2string.daemon import DaemonError, fetch_text
+
+        try:
+            files, final_text, total_tokens = fetch_text(path)
+        except DaemonError as e:
+            print(f"Warning: {e}, scanning locally instead.", file=sys.stderr)
+        else:
+            file_token_info = sorted(files, key=lambda x: x[1], reverse=True)
+            _report(final_text, total_tokens, file_token_info if verbose else None)
+            return
+
+    from repo2string.scan import count_tokens
+
     files_data, content = get_files_content(path)
     final_text = assemble_text(files_data)
     total_tokens = count_tokens(final_text)
@@ -91,20 +116,69 @@ def run_cli(path, verbose=False):
             file_token_info.append((current_file, file_text, count_tokens(file_text)))
 
         file_token_info.sort(key=lambda x: x[2], reverse=True)
+        file_token_info = [(abs_path, tok_count) for abs_path, _, tok_count in file_token_info]
+
+    _report(final_text, total_tokens, file_token_info if verbose else None)
+
+
+def _report(final_text, total_tokens, file_token_info=None):
+    """Copy the final text and print the token summary (and per-file counts, if given)."""
+    import pyperclip
 
     pyperclip.copy(final_text)
     print("Repository contents have been copied to your clipboard!")
     print(f"Total tokens for the entire prompt: {total_tokens}")
 
-    if verbose:
+    if file_token_info is not None:
         print("\nPer-file token counts (descending):")
-        for abs_path, _, tok_count in file_token_info:
+        for abs_path, tok_count in file_token_info:
             print(f"{tok_count:>8}  {abs_path}")
 
 
+def run_daemon_cli(argv):
+    """Entry point for `r2s daemon`."""
+    parser = argparse.ArgumentParser(
+        prog="r2s daemon",
+        description="Keep a warm tokenizer and repository indexes in memory for `r2s --daemon`.",
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        help="Unix socket path (defaults to $REPO2STRING_SOCKET, $XDG_RUNTIME_DIR "
+        "or a private per-user temp directory)",
+    )
+    parser.add_argument(
+        "--max-repos",
+        type=int,
+        default=None,
+        help="Number of repositories kept indexed; the least recently used is dropped first",
+    )
+    args = parser.parse_args(argv)
+
+    from repo2string.daemon import DEFAULT_MAX_INDEXES, DaemonError, run_daemon
+
+    try:
+        run_daemon(args.socket, args.max_repos or DEFAULT_MAX_INDEXES)
+    except DaemonError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
 def main():
+    # `daemon` is a subcommand; a directory of that name is scanned with `r2s ./daemon`
+    if sys.argv[1:2] == ["daemon"]:
+        if os.path.isdir("daemon"):
+            print(
+                "Note: starting the daemon. To scan the 'daemon' directory, run `r2s ./daemon`.",
+                file=sys.stderr,
+            )
+        run_daemon_cli(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
-        description="Convert a repository's tracked files into a single text for LLM context."
+        description="Convert a repository's tracked files into a single text for LLM context.",
+        epilog="Run `r2s daemon` to start the background daemon used by --daemon "
+        "(to scan a directory named 'daemon', pass it as ./daemon).",
     )
     parser.add_argument(
         "path",
@@ -124,6 +198,11 @@ def main():
         action="store_true",
         help="Launch a local browser UI to select specific files and folders",
     )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Use the index of a running `r2s daemon` instead of scanning in-process",
+    )
     args = parser.parse_args()
 
     # Check if path exists
@@ -135,11 +214,11 @@ def main():
     if args.select:
         from repo2string.ui_server import run_ui_server
 
-        run_ui_server(args.path)
+        run_ui_server(args.path, use_daemon=args.daemon)
         sys.exit(0)
 
     # Otherwise, run the original CLI flow
-    run_cli(args.path, args.verbose)
+    run_cli(args.path, args.verbose, use_daemon=args.daemon)
 
 
 if __name__ == "__main__":
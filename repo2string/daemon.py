@@ -0,0 +1,331 @@
+"""
+Optional long-lived daemon that keeps a warm tokenizer and per-repo scan indexes.
+
+`r2s daemon` listens on a Unix domain socket; `r2s --daemon` (and `r2s -s --daemon`)
+send a single JSON request line and read the streamed response:
+
+- {"op": "text", "path": ...}  -> JSON header line with token counts, then the raw text
+- {"op": "files", "path": ...} -> JSON header line, then one JSON line per included file
+- {"op": "ping"}               -> {"status": "ok"}
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Unix domain sockets are not available everywhere (e.g. on Windows)
+HAS_UNIX_SOCKETS = hasattr(socket, "AF_UNIX")
+
+# Number of repositories kept indexed before the least recently used one is dropped
+DEFAULT_MAX_INDEXES = 8
+
+# Seconds a client waits to connect and for each read; the first request for a large
+# repository scans and tokenizes it, so this is generous
+CLIENT_TIMEOUT = 120
+# Seconds run_daemon waits for an existing daemon to answer a ping
+PING_TIMEOUT = 2
+
+
+class DaemonError(Exception):
+    """Raised when the daemon cannot be reached or rejects a request."""
+
+
+def _require_unix_sockets():
+    if not HAS_UNIX_SOCKETS:
+        raise DaemonError("The daemon needs Unix domain sockets, which this platform lacks")
+
+
+def _private_dir(path):
+    """Create path with mode 0700 if needed and check that only the current user can use it."""
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise DaemonError(
+            f"Refusing to use {path}: it must be a directory owned by you with mode 0700"
+        )
+    return path
+
+
+def default_socket_path():
+    """
+    Socket path from $REPO2STRING_SOCKET, else in $XDG_RUNTIME_DIR, else in a private
+    per-user directory (mode 0700) under the temp directory.
+    """
+    _require_unix_sockets()
+    env_path = os.environ.get("REPO2STRING_SOCKET")
+    if env_path:
+        return env_path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, "repo2string.sock")
+    socket_dir = os.path.join(tempfile.gettempdir(), f"repo2string-{os.getuid()}")
+    return os.path.join(_private_dir(socket_dir), "daemon.sock")
+
+
+def _check_owner(socket_path):
+    """Refuse sockets created by another user, who could impersonate the daemon."""
+    try:
+        owner = os.stat(socket_path).st_uid
+    except FileNotFoundError:
+        return
+    if owner != os.getuid():
+        raise DaemonError(f"Refusing to use {socket_path}: it is owned by another user")
+
+
+def _is_socket(path):
+    """Whether path itself (not a symlink target) is a socket; nothing else is ever unlinked."""
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+def _stamp(path):
+    """Return (mtime_ns, size) for path, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class RepoIndex:
+    """
+    In-memory scan index for one repository.
+    Files are re-read and re-tokenized only when their mtime or size changes.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.lock = threading.Lock()
+        self._spec = None
+        self._spec_stamp = None
+        # rel_path -> (stamp, absolute_path, text or None, token_count)
+        self._entries = {}
+        self._assembled_key = None
+        self._assembled = None
+
+    def _refresh(self):
+        # Imported here so that clients (`r2s --daemon`) do not load pathspec or tiktoken
+        from repo2string.scan import count_tokens, iter_candidate_files, load_ignore_spec, read_text
+
+        gitignore_stamp = _stamp(os.path.join(self.path, ".gitignore"))
+        if self._spec is None or gitignore_stamp != self._spec_stamp:
+            self._spec = load_ignore_spec(self.path)
+            self._spec_stamp = gitignore_stamp
+
+        entries = {}
+        for full_path, rel_path in iter_candidate_files(self.path, self._spec):
+            stamp = _stamp(full_path)
+            if stamp is None:
+                # broken symlink or file removed mid-scan
+                continue
+            entry = self._entries.get(rel_path)
+            if entry is None or entry[0] != stamp:
+                text = read_text(full_path)
+                tokens = count_tokens(text) if text is not None else 0
+                entry = (stamp, full_path, text, tokens)
+            entries[rel_path] = entry
+        self._entries = entries
+
+    def included_files(self):
+        """Return the same (absolute_path, relative_path, content, token_count) list as
+        get_included_files, refreshed against the filesystem, with each file's mtime_ns
+        (taken before it was read) appended."""
+        with self.lock:
+            self._refresh()
+            return [
+                (full_path, rel_path, text, tokens, stamp[0])
+                for rel_path, (stamp, full_path, text, tokens) in self._entries.items()
+                if text is not None
+            ]
+
+    def assembled(self):
+        """Return (files, final_text, total_tokens), where files is [(absolute_path, tokens)].
+        The assembled text and its token count are reused while no file has changed."""
+        from repo2string.scan import assemble_text, count_tokens
+
+        with self.lock:
+            self._refresh()
+            key = tuple((rel_path, entry[0]) for rel_path, entry in self._entries.items())
+            if key != self._assembled_key:
+                included = [entry for entry in self._entries.values() if entry[2] is not None]
+                final_text = assemble_text([(entry[1], entry[2]) for entry in included])
+                files = [(entry[1], entry[3]) for entry in included]
+                self._assembled = (files, final_text, count_tokens(final_text))
+                self._assembled_key = key
+            return self._assembled
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def _send(self, obj):
+        self.wfile.write(json.dumps(obj).encode("utf-8") + b"\n")
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            op = request["op"]
+            if op == "ping":
+                self._send({"status": "ok"})
+                return
+            path = os.path.abspath(request["path"])
+        except (ValueError, KeyError, TypeError):
+            self._send({"error": "Invalid request"})
+            return
+
+        if not os.path.isdir(path):
+            self._send({"error": f"Path '{path}' is not a directory"})
+            return
+
+        index = self.server.get_index(path)
+        if op == "files":
+            files = index.included_files()
+            self._send({"count": len(files)})
+            for entry in files:
+                self._send(entry)
+        elif op == "text":
+            files, final_text, total_tokens = index.assembled()
+            data = final_text.encode("utf-8")
+            self._send({"total_tokens": total_tokens, "files": files, "size": len(data)})
+            self.wfile.write(data)
+        else:
+            self._send({"error": f"Unknown op '{op}'"})
+
+
+if HAS_UNIX_SOCKETS:
+
+    class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """
+        Threaded Unix socket server holding one RepoIndex per repository path.
+        At most max_indexes are kept; the least recently used one is evicted first.
+        """
+
+        daemon_threads = True
+
+        def __init__(self, socket_path, max_indexes=DEFAULT_MAX_INDEXES):
+            super().__init__(socket_path, _RequestHandler)
+            self.max_indexes = max_indexes
+            self.indexes = OrderedDict()
+            self.indexes_lock = threading.Lock()
+
+        def get_index(self, path):
+            with self.indexes_lock:
+                index = self.indexes.get(path)
+                if index is None:
+                    index = self.indexes[path] = RepoIndex(path)
+                    while len(self.indexes) > self.max_indexes:
+                        self.indexes.popitem(last=False)
+                else:
+                    self.indexes.move_to_end(path)
+                return index
+
+
+def _connect(socket_path, request, timeout=None):
+    _require_unix_sockets()
+    _check_owner(socket_path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # A wedged daemon must not hang the client; the timeout applies to every read
+    sock.settimeout(timeout or CLIENT_TIMEOUT)
+    try:
+        sock.connect(socket_path)
+    except OSError as e:
+        sock.close()
+        raise DaemonError(f"No repo2string daemon listening on {socket_path}") from e
+    stream = sock.makefile("rb")
+    try:
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        header = json.loads(stream.readline() or b"null")
+    except (OSError, ValueError) as e:
+        stream.close()
+        raise DaemonError(f"Invalid response from the daemon on {socket_path}: {e!r}") from e
+    finally:
+        sock.close()  # the file object keeps the connection open
+    if not isinstance(header, dict):
+        stream.close()
+        raise DaemonError("Daemon closed the connection without a response")
+    if "error" in header:
+        stream.close()
+        raise DaemonError(header["error"])
+    return header, stream
+
+
+def _read_response(stream, read):
+    """Call read(stream) and close it, turning a broken or malformed response into DaemonError."""
+    try:
+        with stream:
+            return read(stream)
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        raise DaemonError(f"Invalid response from the daemon: {e!r}") from e
+
+
+def fetch_included_files(path, socket_path=None, with_mtime=False):
+    """Ask the daemon for the included files of path, in get_included_files format
+    (with each file's mtime_ns appended if with_mtime, like iter_included_files)."""
+    request = {"op": "files", "path": os.path.abspath(path)}
+    header, stream = _connect(socket_path or default_socket_path(), request)
+    width = 5 if with_mtime else 4
+    files = _read_response(stream, lambda s: [tuple(json.loads(line)[:width]) for line in s])
+    if len(files) != header.get("count"):
+        raise DaemonError("The daemon's response was cut short")
+    return files
+
+
+def fetch_text(path, socket_path=None):
+    """Ask the daemon for (files, final_text, total_tokens) of path."""
+    request = {"op": "text", "path": os.path.abspath(path)}
+    header, stream = _connect(socket_path or default_socket_path(), request)
+    data = _read_response(stream, lambda s: s.read())
+    if len(data) != header.get("size"):
+        raise DaemonError("The daemon's response was cut short")
+    try:
+        files = [(full_path, tokens) for full_path, tokens in header["files"]]
+        return files, data.decode("utf-8"), header["total_tokens"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise DaemonError(f"Invalid response from the daemon: {e!r}") from e
+
+
+def run_daemon(socket_path=None, max_indexes=DEFAULT_MAX_INDEXES):
+    """Serve requests on the Unix socket until interrupted."""
+    socket_path = socket_path or default_socket_path()
+    _check_owner(socket_path)
+    if os.path.lexists(socket_path):
+        if not _is_socket(socket_path):
+            raise DaemonError(f"Refusing to replace {socket_path}: it exists and is not a socket")
+        try:
+            _connect(socket_path, {"op": "ping"}, PING_TIMEOUT)[1].close()
+        except DaemonError:
+            # stale socket left behind by a daemon that did not shut down cleanly
+            os.unlink(socket_path)
+        else:
+            print(f"Error: a daemon is already listening on {socket_path}", file=sys.stderr)
+            sys.exit(1)
+
+    # Only the current user may connect
+    old_umask = os.umask(0o077)
+    try:
+        server = DaemonServer(socket_path, max_indexes)
+    finally:
+        os.umask(old_umask)
+    print(f"repo2string daemon listening on {socket_path}")
+
+    # Handle SIGTERM gracefully
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if _is_socket(socket_path):
+            os.unlink(socket_path)
@@ -0,0 +1,145 @@
+import mmap
+import os
+import sys
+import tempfile
+import threading
+from array import array
+
+
+class FileStore:
+    """
+    Compact, append-only store for the included files of one repository.
+    Per-file metadata lives in typed arrays, directory names in a shared string table,
+    and file contents (UTF-8) in a single temporary file that is read back through mmap,
+    so the text of the repository does not stay on the Python heap.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        # Shared string table of directories; files refer to them by id
+        self._dirs = []
+        self._dir_ids = {}
+        self._dir_of = array("I")
+        self._names = []
+        self._offsets = array("Q")
+        self._lengths = array("Q")
+        self._tokens = array("Q")
+        self._mtimes = array("q")
+        self._arena = tempfile.TemporaryFile(prefix="repo2string-")
+        self._arena_size = 0
+        self._map = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, root, files):
+        """Build a store from (absolute_path, relative_path, content, token_count, mtime_ns)
+        tuples, as yielded by iter_included_files(path, with_mtime=True).
+        files may be a generator, in which case only one file's text is in memory at a time."""
+        store = cls(root)
+        try:
+            for full_path, rel_path, text, tokens, mtime_ns in files:
+                store.add(full_path, rel_path, text, tokens, mtime_ns)
+        except BaseException:
+            store.close()
+            raise
+        return store
+
+    def add(self, full_path, rel_path, text, tokens, mtime_ns):
+        """
+        Append a file and return its id.
+        mtime_ns must be taken before text was read, or a write in between goes unnoticed.
+        """
+        data = text.encode("utf-8")
+        dir_name, name = os.path.split(rel_path)
+
+        with self._lock:
+            dir_id = self._dir_ids.get(dir_name)
+            if dir_id is None:
+                dir_id = self._dir_ids[dir_name] = len(self._dirs)
+                self._dirs.append(dir_name)
+            self._dir_of.append(dir_id)
+            self._names.append(name)
+            self._offsets.append(self._arena_size)
+            self._lengths.append(len(data))
+            self._tokens.append(tokens)
+            self._mtimes.append(mtime_ns)
+            self._arena.seek(self._arena_size)
+            self._arena.write(data)
+            self._arena_size += len(data)
+            return len(self._names) - 1
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        """Yield (absolute_path, relative_path, content, token_count), like get_included_files."""
+        for file_id in range(len(self)):
+            rel_path = self.rel_path(file_id)
+            full_path = os.path.join(self.root, rel_path)
+            yield full_path, rel_path, self.text(file_id), self._tokens[file_id]
+
+    def rel_path(self, file_id):
+        return os.path.join(self._dirs[self._dir_of[file_id]], self._names[file_id])
+
+    def abs_path(self, file_id):
+        return os.path.join(self.root, self.rel_path(file_id))
+
+    def token_count(self, file_id):
+        return self._tokens[file_id]
+
+    def byte_count(self, file_id):
+        return self._lengths[file_id]
+
+    def mtime_ns(self, file_id):
+        return self._mtimes[file_id]
+
+    def is_modified(self, file_id):
+        """Whether the file on disk changed (or vanished) since it was stored."""
+        try:
+            return os.stat(self.abs_path(file_id)).st_mtime_ns != self._mtimes[file_id]
+        except OSError:
+            return True
+
+    def metadata(self):
+        """Yield (relative_path, token_count, byte_count) without touching file contents."""
+        for file_id in range(len(self)):
+            yield self.rel_path(file_id), self._tokens[file_id], self._lengths[file_id]
+
+    def text(self, file_id):
+        """Decode a file's content from the arena."""
+        start = self._offsets[file_id]
+        end = start + self._lengths[file_id]
+        if start == end:
+            return ""
+        with self._lock:
+            if self._map is None or len(self._map) < self._arena_size:
+                # Readers may still hold the previous map; it is closed once unreferenced
+                self._arena.flush()
+                self._map = mmap.mmap(self._arena.fileno(), 0, access=mmap.ACCESS_READ)
+            content_map = self._map
+        return content_map[start:end].decode("utf-8")
+
+    def memory_usage(self):
+        """
+        Return the store's own footprint: table_bytes held on the Python heap (metadata
+        arrays and string tables) and content_bytes kept in the on-disk arena.
+        Structures built from the store elsewhere (e.g. folder indexes) are not included.
+        """
+        arrays = (self._dir_of, self._offsets, self._lengths, self._tokens, self._mtimes)
+        strings = self._dirs + self._names
+        table_bytes = (
+            sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+            + sum(sys.getsizeof(s) for s in strings)
+            + sys.getsizeof(self._dirs)
+            + sys.getsizeof(self._names)
+            + sys.getsizeof(self._dir_ids)
+        )
+        return {"files": len(self), "table_bytes": table_bytes, "content_bytes": self._arena_size}
+
+    def close(self):
+        """Release the mmap and the temporary file holding the contents."""
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._arena.close()
@@ -26,10 +26,14 @@ DEFAULT_IGNORE_PATTERNS = [
 try:
     import tiktoken
 
-    ENCODER = tiktoken.encoding_for_model("gpt-4")
+    # Loaded on first use so that thin clients (e.g. `r2s --daemon`) skip the BPE load
+    ENCODER = None
 
     def count_tokens(text):
         """Count tokens in text using tiktoken, treating special tokens as normal text."""
+        global ENCODER
+        if ENCODER is None:
+            ENCODER = tiktoken.encoding_for_model("gpt-4")
         # Treat special tokens as normal text
         return len(ENCODER.encode(text, disallowed_special=()))
 except ImportError:
@@ -39,12 +43,8 @@ except ImportError:
         return len(text.split())
 
 
-def get_included_files(path="."):
-    """
-    Return a list of (absolute_path, relative_path, content, token_count).
-    By default, it ignores any patterns from .gitignore plus some defaults.
-    """
-    abs_path = os.path.abspath(path)
+def load_ignore_spec(abs_path):
+    """Build the PathSpec from the default patterns plus the repo's .gitignore."""
     gitignore_path = os.path.join(abs_path, ".gitignore")
 
     patterns = DEFAULT_IGNORE_PATTERNS.copy()
@@ -52,26 +52,62 @@ def get_included_files(path="."):
         with open(gitignore_path, "r", encoding="utf-8") as f:
             patterns.extend(f.readlines())
 
-    spec = PathSpec.from_lines("gitwildmatch", patterns)
+    return PathSpec.from_lines("gitwildmatch", patterns)
 
-    result = []
+
+def iter_candidate_files(abs_path, spec):
+    """Yield (absolute_path, relative_path) for every file not matched by spec."""
     for root, _, files in os.walk(abs_path):
         for file in files:
             full_path = os.path.join(root, file)
             rel_path = os.path.relpath(full_path, abs_path)
             if spec.match_file(rel_path):
                 continue
+            yield full_path, rel_path
+
+
+def read_text(full_path):
+    """Return the file's text, or None if it is binary or unreadable."""
+    try:
+        with open(full_path, "r", encoding="utf-8") as rf:
+            return rf.read()
+    except (UnicodeDecodeError, IOError):
+        return None
+
+
+def iter_included_files(path=".", with_mtime=False):
+    """
+    Yield (absolute_path, relative_path, content, token_count) one file at a time,
+    so callers can store them without holding every file's text at once.
+    With with_mtime, each tuple ends with the file's mtime in nanoseconds (0 if unknown),
+    taken before the file is read so that a write during the scan counts as a change.
+    By default, it ignores any patterns from .gitignore plus some defaults.
+    """
+    abs_path = os.path.abspath(path)
+    spec = load_ignore_spec(abs_path)
 
+    for full_path, rel_path in iter_candidate_files(abs_path, spec):
+        if with_mtime:
             try:
-                with open(full_path, "r", encoding="utf-8") as rf:
-                    text = rf.read()
-                tokens = count_tokens(text)
-                result.append((full_path, rel_path, text, tokens))
-            except (UnicodeDecodeError, IOError):
-                # binary or unreadable file
-                continue
+                mtime_ns = os.stat(full_path).st_mtime_ns
+            except OSError:
+                mtime_ns = 0
+        text = read_text(full_path)
+        if text is None:
+            # binary or unreadable file
+            continue
+        if with_mtime:
+            yield full_path, rel_path, text, count_tokens(text), mtime_ns
+        else:
+            yield full_path, rel_path, text, count_tokens(text)
+
 
-    return result
+def get_included_files(path="."):
+    """
+    Return a list of (absolute_path, relative_path, content, token_count).
+    By default, it ignores any patterns from .gitignore plus some defaults.
+    """
+    return list(iter_included_files(path))
 
 
 def get_files_content(path="."):
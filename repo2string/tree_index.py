@@ -0,0 +1,245 @@
+import sys
+import threading
+import weakref
+
+# Selected (files, tokens, bytes) of a node with nothing selected, shared by every overlay
+_NOTHING = (0, 0, 0)
+
+
+class _Node:
+    __slots__ = ("name", "path", "parent", "children", "files", "tokens", "bytes")
+
+    def __init__(self, name, path, parent, is_folder):
+        self.name = name
+        self.path = path
+        self.parent = parent
+        # None for files, name -> _Node for folders
+        self.children = {} if is_folder else None
+        self.files = 0
+        self.tokens = 0
+        self.bytes = 0
+
+    def totals(self):
+        return self.files, self.tokens, self.bytes
+
+    def summary(self, selected):
+        return {
+            "name": self.name,
+            "path": self.path,
+            "type": "file" if self.children is None else "folder",
+            "files": self.files,
+            "tokens": self.tokens,
+            "bytes": self.bytes,
+            "selected": {"files": selected[0], "tokens": selected[1], "bytes": selected[2]},
+        }
+
+
+class DirectoryIndex:
+    """
+    Directory tree with token, byte and file counts aggregated at every folder.
+    Built once; each Selection layers its own selected counts over the shared tree.
+    Lookups and adding, updating or removing a file are O(depth) per open selection;
+    (un)selecting a folder is O(subtree).
+    Paths are relative and '/'-separated; the root folder is "".
+    """
+
+    def __init__(self):
+        self.root = _Node("", "", None, is_folder=True)
+        self.lock = threading.Lock()
+        # Kept up to date when files change; dropped once their owner forgets them
+        self._selections = weakref.WeakSet()
+
+    @classmethod
+    def from_files(cls, files):
+        """Build an index from (relative_path, token_count, byte_count) tuples."""
+        index = cls()
+        for rel_path, tokens, nbytes in files:
+            index.add_file(rel_path, tokens, nbytes)
+        return index
+
+    def selection(self):
+        """Start a Selection with every file selected. O(1): nothing is copied."""
+        selection = Selection(self)
+        with self.lock:
+            self._selections.add(selection)
+        return selection
+
+    def _find(self, path):
+        node = self.root
+        if path:
+            for part in path.split("/"):
+                if node.children is None or part not in node.children:
+                    raise KeyError(path)
+                node = node.children[part]
+        return node
+
+    def _propagate(self, node, delta, selected_deltas):
+        """
+        Add delta (files, tokens, bytes) to the totals of node and its ancestors,
+        and selected_deltas[selection] to the selected counts of each selection.
+        """
+        if not selected_deltas:
+            # No open selections, e.g. while the index is built
+            while node is not None:
+                node.files += delta[0]
+                node.tokens += delta[1]
+                node.bytes += delta[2]
+                node = node.parent
+            return
+        while node is not None:
+            before = [(s, s._get(node)) for s in selected_deltas]
+            node.files += delta[0]
+            node.tokens += delta[1]
+            node.bytes += delta[2]
+            for selection, selected in before:
+                d = selected_deltas[selection]
+                selection._set(node, (selected[0] + d[0], selected[1] + d[1], selected[2] + d[2]))
+            node = node.parent
+
+    def add_file(self, rel_path, tokens, nbytes):
+        """
+        Add a file, creating its folders, or update the counts of an existing one.
+        A new file is selected in a selection unless its folder has nothing selected there;
+        an existing file keeps its selection state.
+        """
+        with self.lock:
+            selections = list(self._selections) if self._selections else []
+            parts = rel_path.split("/")
+            # Walk down the folders that already exist
+            node = self.root
+            depth = 0
+            while depth < len(parts) - 1:
+                child = node.children.get(parts[depth])
+                if child is None:
+                    break
+                if child.children is None:
+                    raise ValueError(f"'{child.path}' is a file, not a folder")
+                node = child
+                depth += 1
+
+            leaf = node.children.get(parts[-1]) if depth == len(parts) - 1 else None
+            if leaf is not None:
+                if leaf.children is not None:
+                    raise ValueError(f"'{rel_path}' is a folder, not a file")
+                delta = (0, tokens - leaf.tokens, nbytes - leaf.bytes)
+                self._propagate(
+                    leaf,
+                    delta,
+                    {s: delta if s._get(leaf)[0] else _NOTHING for s in selections},
+                )
+                return
+
+            # Decide per selection from the deepest existing folder, before counts change
+            delta = (1, tokens, nbytes)
+            selected_deltas = {
+                s: _NOTHING if node.files and not s._get(node)[0] else delta for s in selections
+            }
+            for i in range(depth, len(parts) - 1):
+                child = _Node(parts[i], "/".join(parts[: i + 1]), node, is_folder=True)
+                node.children[parts[i]] = child
+                node = child
+            leaf = _Node(parts[-1], rel_path, node, is_folder=False)
+            node.children[parts[-1]] = leaf
+            self._propagate(leaf, delta, selected_deltas)
+
+    def remove_file(self, rel_path):
+        """Remove a file and prune the folders it leaves empty."""
+        with self.lock:
+            leaf = self._find(rel_path)
+            if leaf.children is not None:
+                raise KeyError(rel_path)
+            delta = tuple(-n for n in leaf.totals())
+            selected_deltas = {s: tuple(-n for n in s._get(leaf)) for s in self._selections}
+            self._propagate(leaf, delta, selected_deltas)
+
+            node = leaf
+            while node.parent is not None and (node.children is None or not node.children):
+                del node.parent.children[node.name]
+                for selection in self._selections:
+                    selection._overlay.pop(node, None)
+                node = node.parent
+
+    def memory_usage(self):
+        """Return the number of nodes and their approximate size in bytes."""
+        with self.lock:
+            nodes = 0
+            nbytes = 0
+            stack = [self.root]
+            while stack:
+                node = stack.pop()
+                nodes += 1
+                nbytes += sys.getsizeof(node) + sys.getsizeof(node.path)
+                if node.children is not None:
+                    nbytes += sys.getsizeof(node.children)
+                    stack.extend(node.children.values())
+            return {"nodes": nodes, "bytes": nbytes}
+
+
+class Selection:
+    """
+    One client's selection over a DirectoryIndex.
+    Only nodes whose selected counts differ from their totals are stored,
+    so a new selection (everything selected) costs nothing until files are unselected.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        # node -> selected (files, tokens, bytes); a missing node is fully selected
+        self._overlay = {}
+
+    def _get(self, node):
+        selected = self._overlay.get(node)
+        return node.totals() if selected is None else selected
+
+    def _set(self, node, selected):
+        if selected == node.totals():
+            self._overlay.pop(node, None)
+        else:
+            self._overlay[node] = _NOTHING if selected == _NOTHING else selected
+
+    def set_selected(self, path, selected):
+        """(Un)select a file, or every file under a folder."""
+        with self.index.lock:
+            node = self.index._find(path)
+            before = self._get(node)
+            after = node.totals() if selected else _NOTHING
+
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                if selected:
+                    self._overlay.pop(current, None)
+                else:
+                    self._overlay[current] = _NOTHING
+                if current.children:
+                    stack.extend(current.children.values())
+
+            delta = tuple(a - b for a, b in zip(after, before))
+            self.index._propagate(node.parent, _NOTHING, {self: delta})
+
+    def summary(self, path=""):
+        """Totals and selected totals of a file or folder, in O(depth)."""
+        with self.index.lock:
+            node = self.index._find(path)
+            return node.summary(self._get(node))
+
+    def ancestors(self, path):
+        """Summaries of every folder from the root down to path's parent, in O(depth)."""
+        with self.index.lock:
+            node = self.index._find(path).parent
+            chain = []
+            while node is not None:
+                chain.append(node.summary(self._get(node)))
+                node = node.parent
+            return chain[::-1]
+
+    def folder(self, path=""):
+        """Summary of a file or folder plus the summaries of its direct children."""
+        with self.index.lock:
+            node = self.index._find(path)
+            result = node.summary(self._get(node))
+            if node.children is not None:
+                result["children"] = [
+                    child.summary(self._get(child)) for child in node.children.values()
+                ]
+            return result
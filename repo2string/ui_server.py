@@ -1,52 +1,233 @@
-import logging
+import gzip
+import hashlib
+import json
 import os
+import secrets
 import signal
+import socketserver
 import sys
 import threading
 import webbrowser
+from collections import OrderedDict
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
 
 import pyperclip
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request
 
-from repo2string.scan import assemble_text, get_included_files
+from repo2string.file_store import FileStore
+from repo2string.scan import assemble_text, iter_included_files
+from repo2string.tree_index import DirectoryIndex
 
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; responses are gzip-compressed without it
+    brotli = None
 
-def create_app(base_path=None):
-    """Create and configure the Flask application."""
-    # Configure Flask to show minimal output
-    cli = sys.modules["flask.cli"]
-    cli.show_server_banner = lambda *args: None
+# Number of open pages whose selections are kept; the least recently used is dropped first
+MAX_SELECTION_SESSIONS = 8
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = 1024
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _static_body(body):
+    """Pair a static body with its ETag, computed once."""
+    return body, hashlib.sha1(body).hexdigest()
+
+
+def _cached_response(static_body, mimetype):
+    """Build a revalidatable response for a _static_body, answering 304 on a matching ETag."""
+    body, etag = static_body
+    response = Response(body, mimetype=mimetype)
+    # Weak, so that the same ETag stays valid for every Content-Encoding of the body
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """Stdlib WSGI server handling each request in its own thread."""
 
-    log = logging.getLogger("werkzeug")
-    log.setLevel(logging.ERROR)
+    daemon_threads = True
 
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+    """Request handler that does not log every request to stderr."""
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _load_files(abs_path, use_daemon):
+    """Scan abs_path file by file, or take the file list from a running daemon's index."""
+    if use_daemon:
+        from repo2string.daemon import DaemonError, fetch_included_files
+
+        try:
+            return fetch_included_files(abs_path, with_mtime=True)
+        except DaemonError as e:
+            print(f"Warning: {e}, scanning locally instead.", file=sys.stderr)
+    return iter_included_files(abs_path, with_mtime=True)
+
+
+def create_app(base_path=None, use_daemon=False):
+    """Create and configure the Flask application."""
     app = Flask(__name__, static_folder=None)  # We'll serve ui.html by a custom route
 
-    # Store path and files in app config
+    # Store path and files in app config; file contents are kept in the store's on-disk arena
     app.config["BASE_PATH"] = base_path
-    app.config["ALL_FILES"] = []
-    if base_path:
-        app.config["ALL_FILES"] = get_included_files(os.path.abspath(base_path))
+    root_path = os.path.abspath(base_path or ".")
+    files = _load_files(root_path, use_daemon) if base_path else []
+    app.config["FILE_STORE"] = FileStore.from_files(root_path, files)
+    # Folder totals are aggregated once; each open page keeps a Selection over them,
+    # keyed by session id
+    app.config["DIRECTORY_INDEX"] = DirectoryIndex.from_files(app.config["FILE_STORE"].metadata())
+    app.config["SELECTION_SESSIONS"] = OrderedDict()
+    sessions_lock = threading.Lock()
+
+    # Static bodies are built once and their compressed variants are cached by ETag
+    ui_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ui.html")
+    with open(ui_path, "rb") as f:
+        ui_html = _static_body(f.read())
+    static_bodies = {}
+    compressed_cache = {}
 
     @app.route("/")
     def serve_ui():
         """Serve the single-page app from ui.html in the same directory."""
-        dir_path = os.path.dirname(os.path.abspath(__file__))
-        return send_from_directory(dir_path, "ui.html")
+        return _cached_response(ui_html, "text/html")
 
     @app.route("/api/files", methods=["GET"])
     def api_files():
-        """Return file tree and token counts."""
-        data = []
-        for full_path, rel_path, _, tokens in app.config["ALL_FILES"]:
-            data.append(
+        """
+        Return file tree and token counts as columns:
+        {"basePath", "rootPath", "files": {"relPath": [...], "tokens": [...]}}.
+        Absolute paths are rootPath joined with relPath.
+        """
+        if "files" not in static_bodies:
+            metadata = list(app.config["FILE_STORE"].metadata())
+            base_path = app.config["BASE_PATH"]
+            payload = {
+                "basePath": base_path,
+                "rootPath": os.path.abspath(base_path) if base_path else None,
+                "files": {
+                    "relPath": [rel_path for rel_path, _, _ in metadata],
+                    "tokens": [tokens for _, tokens, _ in metadata],
+                },
+            }
+            static_bodies["files"] = _static_body(
+                json.dumps(payload, separators=(",", ":")).encode("utf-8")
+            )
+        return _cached_response(static_bodies["files"], "application/json")
+
+    @app.route("/api/session", methods=["POST"])
+    def api_session():
+        """
+        Start a selection session for one page, with everything selected.
+        Sessions share the folder index, so tabs and reloads do not share a selection
+        and starting one does not rescan the file list.
+        """
+        selection = app.config["DIRECTORY_INDEX"].selection()
+        session_id = secrets.token_hex(8)
+        with sessions_lock:
+            sessions = app.config["SELECTION_SESSIONS"]
+            sessions[session_id] = selection
+            while len(sessions) > MAX_SELECTION_SESSIONS:
+                sessions.popitem(last=False)
+        return jsonify({"session": session_id, "total": selection.summary()})
+
+    def get_selection(session_id):
+        with sessions_lock:
+            selection = app.config["SELECTION_SESSIONS"].get(session_id)
+            if selection is not None:
+                app.config["SELECTION_SESSIONS"].move_to_end(session_id)
+            return selection
+
+    @app.route("/api/folder", methods=["GET"])
+    def api_folder():
+        """
+        Return the totals and selected totals of a file or folder (default: root)
+        in a session, with those of a folder's direct children.
+        """
+        session_id = request.args.get("session")
+        path = request.args.get("path", "")
+        if session_id is None:
+            return jsonify({"error": "Missing session"}), 400
+
+        selection = get_selection(session_id)
+        if selection is None:
+            return jsonify({"error": "Unknown session"}), 404
+        try:
+            return jsonify(selection.folder(path))
+        except KeyError:
+            return jsonify({"error": f"Unknown path '{path}'"}), 404
+
+    @app.route("/api/select", methods=["POST"])
+    def api_select():
+        """
+        (Un)select a file or folder in a session and return the updated totals of the node,
+        of its ancestors (root first) and of the whole selection.
+        """
+        data = request.get_json(silent=True)
+        if (
+            not isinstance(data, dict)
+            or not isinstance(data.get("session"), str)
+            or not isinstance(data.get("path"), str)
+            or not isinstance(data.get("selected"), bool)
+        ):
+            return jsonify({"error": "Invalid JSON"}), 400
+
+        selection = get_selection(data["session"])
+        if selection is None:
+            return jsonify({"error": "Unknown session"}), 404
+
+        path = data["path"]
+        try:
+            selection.set_selected(path, data["selected"])
+            return jsonify(
                 {
-                    "relPath": rel_path,
-                    "absPath": full_path,
-                    "tokens": tokens,
+                    "node": selection.summary(path),
+                    "ancestors": selection.ancestors(path) if path else [],
+                    "total": selection.summary(),
                 }
             )
-        return jsonify({"files": data, "basePath": app.config["BASE_PATH"]})
+        except KeyError:
+            return jsonify({"error": f"Unknown path '{path}'"}), 404
+
+    @app.after_request
+    def compress_response(response):
+        """Compress large responses with brotli or gzip, as accepted by the client."""
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+        ):
+            return response
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None:
+            return response
+
+        etag, _ = response.get_etag()
+        compressed = compressed_cache.get((etag, encoding)) if etag else None
+        if compressed is None:
+            compressed = _compress(data, encoding)
+            if etag:
+                compressed_cache[(etag, encoding)] = compressed
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        return response
 
     @app.route("/api/submit", methods=["POST"])
     def api_submit():
@@ -55,14 +236,29 @@ def create_app(base_path=None):
             return jsonify({"error": "Invalid JSON"}), 400
 
         data = request.get_json()
-        included_paths = data.get("include", [])
+        included_paths = set(data.get("include", []))
         filtered = []
         total_tokens = 0
 
-        for full_path, rel_path, text, tokens in app.config["ALL_FILES"]:
+        modified = []
+
+        store = app.config["FILE_STORE"]
+        for file_id in range(len(store)):
+            rel_path = store.rel_path(file_id)
             if rel_path in included_paths:
-                filtered.append((full_path, text))
-                total_tokens += tokens
+                filtered.append((store.abs_path(file_id), store.text(file_id)))
+                total_tokens += store.token_count(file_id)
+                if store.is_modified(file_id):
+                    modified.append(rel_path)
+
+        if modified:
+            print(
+                f"\nWarning: {len(modified)} file(s) changed on disk since the UI was opened; "
+                "copying the versions shown in the UI:",
+                file=sys.stderr,
+            )
+            for rel_path in modified:
+                print(f"  {rel_path}", file=sys.stderr)
 
         final_text = assemble_text(filtered)
         pyperclip.copy(final_text)
@@ -78,28 +274,37 @@ def create_app(base_path=None):
                 )
             ).start()
 
-        return jsonify({"status": "ok", "total_tokens": total_tokens})
+        return jsonify({"status": "ok", "total_tokens": total_tokens, "modified": modified})
 
     return app
 
 
-def run_ui_server(path):
+def run_ui_server(path, use_daemon=False):
     """
     The main entry point from the CLI when --ui is used.
     Gathers file data, starts the server on a free port, and opens the browser.
+    With use_daemon, the file data comes from a running `r2s daemon` instead of a scan.
     """
     # Create and configure the app
-    app = create_app(path)
-
-    # Find an available port
-    import socket
-
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.bind(("127.0.0.1", 0))
-    port = s.getsockname()[1]
-    s.close()
+    app = create_app(path, use_daemon=use_daemon)
+    store = app.config["FILE_STORE"]
+    usage = store.memory_usage()
+    index_usage = app.config["DIRECTORY_INDEX"].memory_usage()
+    print(
+        f"Indexed {usage['files']} files: {usage['table_bytes'] / 1024:.1f} KiB file table "
+        f"and {index_usage['bytes'] / 1024:.1f} KiB folder index in memory, "
+        f"{usage['content_bytes'] / 1024 / 1024:.1f} MiB of text in a temporary file"
+    )
 
-    url = f"http://127.0.0.1:{port}"
+    # Bind to a free port chosen by the OS
+    server = make_server(
+        "127.0.0.1",
+        0,
+        app,
+        server_class=ThreadingWSGIServer,
+        handler_class=QuietWSGIRequestHandler,
+    )
+    url = f"http://127.0.0.1:{server.server_port}"
     print(f"Running on {url}")
 
     # Open the browser automatically
@@ -108,4 +313,8 @@ def run_ui_server(path):
     # Handle SIGTERM gracefully
     signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
 
-    app.run(host="127.0.0.1", port=port)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        store.close()
@@ -0,0 +1,337 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+if not hasattr(socket, "AF_UNIX"):
+    pytest.skip("Unix domain sockets are not available", allow_module_level=True)
+
+import repo2string.daemon
+from repo2string.cli import main
+from repo2string.daemon import (
+    DaemonError,
+    DaemonServer,
+    default_socket_path,
+    fetch_included_files,
+    fetch_text,
+    run_daemon,
+)
+from repo2string.scan import get_included_files, read_text
+from repo2string.ui_server import create_app
+
+
+@pytest.fixture
+def socket_path():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        yield os.path.join(tmpdir, "r2s.sock")
+
+
+@pytest.fixture
+def server(socket_path):
+    server = DaemonServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def repo():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        test_dir = Path(tmpdir)
+        (test_dir / "a.py").write_text("print('a')")
+        (test_dir / "sub").mkdir()
+        (test_dir / "sub" / "b.py").write_text("print('b')")
+        (test_dir / "binary.bin").write_bytes(bytes([0x89, 0x50, 0x4E, 0x47]))
+        yield test_dir
+
+
+def test_fetch_included_files_matches_scan(server, socket_path, repo):
+    """The daemon returns the same file list as an in-process scan."""
+    files = fetch_included_files(str(repo), socket_path)
+    assert sorted(files) == sorted(get_included_files(str(repo)))
+
+
+def test_fetch_text(server, socket_path, repo):
+    """The daemon streams back the assembled text and token counts."""
+    files, final_text, total_tokens = fetch_text(str(repo), socket_path)
+    assert "print('a')" in final_text
+    assert "print('b')" in final_text
+    assert "binary.bin" not in final_text
+    assert total_tokens > 0
+    assert {os.path.basename(f[0]) for f in files} == {"a.py", "b.py"}
+
+
+def test_index_invalidated_by_mtime(server, socket_path, repo):
+    """Changed, added and removed files are picked up on the next request."""
+    fetch_text(str(repo), socket_path)
+
+    with patch("repo2string.scan.read_text", wraps=read_text) as mock_read:
+        _, final_text, _ = fetch_text(str(repo), socket_path)
+        assert "print('a')" in final_text
+        # Nothing changed, so nothing is re-read
+        assert not mock_read.called
+
+        (repo / "a.py").write_text("print('changed a')")
+        (repo / "c.py").write_text("print('c')")
+        (repo / "sub" / "b.py").unlink()
+        _, final_text, _ = fetch_text(str(repo), socket_path)
+        assert {os.path.basename(c.args[0]) for c in mock_read.call_args_list} == {"a.py", "c.py"}
+
+    assert "print('changed a')" in final_text
+    assert "print('c')" in final_text
+    assert "print('b')" not in final_text
+
+
+def test_invalid_path(server, socket_path):
+    """Requests for a nonexistent path are rejected."""
+    with pytest.raises(DaemonError):
+        fetch_text("/nonexistent/path", socket_path)
+
+
+def test_no_daemon(socket_path):
+    """Connecting without a daemon raises DaemonError."""
+    with pytest.raises(DaemonError):
+        fetch_text(".", socket_path)
+
+
+def test_cli_daemon(server, socket_path, repo, capsys):
+    """`r2s --daemon` gets its result from the daemon."""
+    with patch.dict(os.environ, {"REPO2STRING_SOCKET": socket_path}):
+        with patch("sys.argv", ["repo2string", str(repo), "--daemon", "--verbose"]):
+            with patch("pyperclip.copy") as mock_copy:
+                main()
+    captured = capsys.readouterr()
+    assert "copied to your clipboard" in captured.out
+    assert "a.py" in captured.out
+    assert "print('a')" in mock_copy.call_args[0][0]
+    assert str(repo) in server.indexes
+
+
+THIN_CLIENT_SCRIPT = """
+import sys
+import types
+
+# No clipboard here; pyperclip itself is only imported once the daemon has answered
+sys.modules["pyperclip"] = types.SimpleNamespace(copy=lambda text: None)
+sys.argv = ["repo2string", sys.argv[1], "--daemon"]
+
+from repo2string.cli import main
+
+main()
+print([name for name in ("pathspec", "tiktoken") if sys.modules.get(name) is not None])
+"""
+
+
+def test_cli_daemon_is_thin(server, socket_path, repo):
+    """`r2s --daemon` does not import pathspec or tiktoken for a daemon round trip."""
+    result = subprocess.run(
+        [sys.executable, "-c", THIN_CLIENT_SCRIPT, str(repo)],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "REPO2STRING_SOCKET": socket_path},
+    )
+    assert "scanning locally" not in result.stderr
+    assert result.stdout.splitlines()[-1] == "[]"
+
+
+def test_cli_daemon_fallback(socket_path, repo, capsys):
+    """`r2s --daemon` falls back to a local scan if no daemon is running."""
+    with patch.dict(os.environ, {"REPO2STRING_SOCKET": socket_path}):
+        with patch("sys.argv", ["repo2string", str(repo), "--daemon"]):
+            with patch("pyperclip.copy") as mock_copy:
+                main()
+    captured = capsys.readouterr()
+    assert "scanning locally" in captured.err
+    assert "print('a')" in mock_copy.call_args[0][0]
+
+
+def test_ui_attaches_to_daemon(server, socket_path, repo):
+    """The selection UI can take its file list from the daemon."""
+    with patch.dict(os.environ, {"REPO2STRING_SOCKET": socket_path}):
+        app = create_app(str(repo), use_daemon=True)
+    try:
+        store = app.config["FILE_STORE"]
+        assert sorted(store) == sorted(get_included_files(str(repo)))
+        assert str(repo) in server.indexes
+        assert not any(store.is_modified(i) for i in range(len(store)))
+    finally:
+        app.config["FILE_STORE"].close()
+
+
+def test_lru_eviction(socket_path):
+    """Only the most recently used indexes are kept."""
+    server = DaemonServer(socket_path, max_indexes=2)
+    try:
+        server.get_index("/a")
+        server.get_index("/b")
+        server.get_index("/a")
+        server.get_index("/c")
+        assert list(server.indexes) == ["/a", "/c"]
+    finally:
+        server.server_close()
+
+
+def test_default_socket_path(tmp_path):
+    """The default socket lives in $XDG_RUNTIME_DIR or a private temp directory."""
+    env = {"XDG_RUNTIME_DIR": str(tmp_path)}
+    with patch.dict(os.environ, env):
+        os.environ.pop("REPO2STRING_SOCKET", None)
+        assert default_socket_path() == str(tmp_path / "repo2string.sock")
+
+    with patch.dict(os.environ, {}):
+        os.environ.pop("REPO2STRING_SOCKET", None)
+        os.environ.pop("XDG_RUNTIME_DIR", None)
+        with patch("tempfile.gettempdir", return_value=str(tmp_path)):
+            path = default_socket_path()
+            socket_dir = os.path.dirname(path)
+            assert os.stat(socket_dir).st_mode & 0o777 == 0o700
+
+            # A directory that others can write to is refused
+            os.chmod(socket_dir, 0o777)
+            with pytest.raises(DaemonError):
+                default_socket_path()
+
+
+def test_foreign_socket_refused(server, socket_path, repo):
+    """A socket owned by another user is never connected to."""
+    with patch("os.getuid", return_value=os.getuid() + 1):
+        with pytest.raises(DaemonError, match="another user"):
+            fetch_text(str(repo), socket_path)
+
+
+def test_no_unix_sockets(socket_path, repo, capsys):
+    """Without Unix domain sockets --daemon falls back to a local scan."""
+    with patch.object(repo2string.daemon, "HAS_UNIX_SOCKETS", False):
+        with pytest.raises(DaemonError):
+            fetch_text(str(repo), socket_path)
+        with patch("sys.argv", ["repo2string", str(repo), "--daemon"]):
+            with patch("pyperclip.copy") as mock_copy:
+                main()
+    assert "scanning locally" in capsys.readouterr().err
+    assert "print('a')" in mock_copy.call_args[0][0]
+
+
+def test_daemon_directory_escape(tmp_path, monkeypatch, capsys):
+    """A directory named 'daemon' is scanned when passed as ./daemon."""
+    (tmp_path / "daemon").mkdir()
+    (tmp_path / "daemon" / "x.py").write_text("print('x')")
+    monkeypatch.chdir(tmp_path)
+
+    with patch("sys.argv", ["repo2string", "./daemon"]):
+        with patch("pyperclip.copy") as mock_copy:
+            main()
+    assert "print('x')" in mock_copy.call_args[0][0]
+
+    with patch("sys.argv", ["repo2string", "daemon"]):
+        with patch("repo2string.daemon.run_daemon") as mock_run:
+            main()
+    assert mock_run.called
+    assert "./daemon" in capsys.readouterr().err
+
+
+def test_run_daemon_replaces_stale_socket(socket_path):
+    """A socket nobody listens on is removed and the daemon binds a fresh one."""
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+
+    def serve_once(self):
+        # The new socket accepts connections, unlike the stale one
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(socket_path)
+        raise KeyboardInterrupt
+
+    with patch.object(DaemonServer, "serve_forever", serve_once):
+        with patch("signal.signal"):
+            run_daemon(socket_path)
+    # Removed again on shutdown
+    assert not os.path.lexists(socket_path)
+
+
+def test_run_daemon_refuses_non_socket(tmp_path):
+    """A path that is not a socket, e.g. a mistyped --socket, is never deleted."""
+    notes = tmp_path / "notes.txt"
+    notes.write_text("important")
+    with pytest.raises(DaemonError, match="not a socket"):
+        run_daemon(str(notes))
+    assert notes.read_text() == "important"
+
+
+@pytest.fixture
+def fake_daemon(socket_path):
+    """Serve one connection on socket_path with the given reply function."""
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(1)
+    threads = []
+
+    def serve(reply):
+        def run():
+            conn, _ = listener.accept()
+            with conn:
+                conn.makefile("rb").readline()
+                reply(conn)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    yield serve
+    listener.close()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_malformed_response(fake_daemon, socket_path, repo, capsys):
+    """A peer that does not speak the protocol raises DaemonError, so the CLI falls back."""
+    fake_daemon(lambda conn: conn.sendall(b"HTTP/1.1 400 Bad Request\r\n\r\n"))
+    with pytest.raises(DaemonError, match="Invalid response"):
+        fetch_text(str(repo), socket_path)
+
+    fake_daemon(lambda conn: conn.sendall(b"not json\n"))
+    with patch.dict(os.environ, {"REPO2STRING_SOCKET": socket_path}):
+        with patch("sys.argv", ["repo2string", str(repo), "--daemon"]):
+            with patch("pyperclip.copy") as mock_copy:
+                main()
+    assert "scanning locally" in capsys.readouterr().err
+    assert "print('a')" in mock_copy.call_args[0][0]
+
+
+def test_response_cut_short(fake_daemon, socket_path, repo):
+    """A daemon that dies mid-stream raises DaemonError instead of returning partial data."""
+    fake_daemon(lambda conn: conn.sendall(b'{"count": 2}\n["/a.py", "a.py", "x", 1]\n'))
+    with pytest.raises(DaemonError, match="cut short"):
+        fetch_included_files(str(repo), socket_path)
+
+    header = b'{"total_tokens": 1, "files": [], "size": 100}\n'
+    fake_daemon(lambda conn: conn.sendall(header + b"partial"))
+    with pytest.raises(DaemonError, match="cut short"):
+        fetch_text(str(repo), socket_path)
+
+    fake_daemon(lambda conn: conn.sendall(b'{"count": 1}\n["/a.py", "a\xff'))
+    with pytest.raises(DaemonError):
+        fetch_included_files(str(repo), socket_path)
+
+
+def test_wedged_daemon_times_out(fake_daemon, socket_path, repo):
+    """A daemon that never answers does not hang the client."""
+    released = threading.Event()
+    fake_daemon(lambda conn: released.wait(10))
+    start = time.monotonic()
+    try:
+        with patch.object(repo2string.daemon, "CLIENT_TIMEOUT", 0.2):
+            with pytest.raises(DaemonError):
+                fetch_text(str(repo), socket_path)
+    finally:
+        released.set()
+    assert time.monotonic() - start < 5
@@ -0,0 +1,175 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from repo2string.file_store import FileStore
+from repo2string.scan import get_included_files, iter_included_files, read_text
+
+
+@pytest.fixture
+def repo(tmp_path):
+    (tmp_path / "a.py").write_text("print('a')")
+    (tmp_path / "empty.txt").write_text("")
+    (tmp_path / "pkg" / "sub").mkdir(parents=True)
+    (tmp_path / "pkg" / "unicode-⭐️.txt").write_text("zażółć gęślą jaźń ⭐️", encoding="utf-8")
+    (tmp_path / "pkg" / "sub" / "b.py").write_text("print('b')\n" * 100)
+    (tmp_path / "pkg" / "sub" / "c.py").write_text("print('c')")
+    return tmp_path
+
+
+@pytest.fixture
+def store(repo):
+    store = FileStore.from_files(str(repo), iter_included_files(str(repo), with_mtime=True))
+    yield store
+    store.close()
+
+
+def test_round_trip(repo, store):
+    """The store returns the same files, paths, texts and token counts as a scan."""
+    assert sorted(store) == sorted(get_included_files(str(repo)))
+
+    for file_id in range(len(store)):
+        full_path = Path(store.abs_path(file_id))
+        assert store.byte_count(file_id) == len(full_path.read_bytes())
+        assert store.mtime_ns(file_id) == os.stat(full_path).st_mtime_ns
+
+
+def test_metadata_and_string_table(store):
+    """Directory names are stored once and metadata does not read contents."""
+    assert {rel_path for rel_path, _, _ in store.metadata()} == {
+        "a.py",
+        "empty.txt",
+        os.path.join("pkg", "unicode-⭐️.txt"),
+        os.path.join("pkg", "sub", "b.py"),
+        os.path.join("pkg", "sub", "c.py"),
+    }
+    assert sorted(store._dirs) == ["", "pkg", os.path.join("pkg", "sub")]
+
+
+def test_memory_usage(store):
+    """The reported footprint separates the in-memory file table from the content arena."""
+    usage = store.memory_usage()
+    assert usage["files"] == 5
+    assert usage["content_bytes"] == sum(store.byte_count(i) for i in range(len(store)))
+    assert usage["table_bytes"] > 0
+
+
+def test_is_modified(repo, store):
+    """Files changed or removed after being stored are reported as modified."""
+    ids = {store.rel_path(i): i for i in range(len(store))}
+    assert not any(store.is_modified(i) for i in ids.values())
+
+    os.utime(repo / "a.py", ns=(0, 0))
+    (repo / "empty.txt").unlink()
+    assert store.is_modified(ids["a.py"])
+    assert store.is_modified(ids["empty.txt"])
+    assert not store.is_modified(ids[os.path.join("pkg", "sub", "c.py")])
+
+
+def test_change_during_scan_is_modified(repo):
+    """A file written after its stat but before it is read still counts as modified."""
+
+    def read_then_write(full_path):
+        text = read_text(full_path)
+        if full_path.endswith("a.py"):
+            mtime_ns = os.stat(full_path).st_mtime_ns
+            Path(full_path).write_text("print('changed')")
+            os.utime(full_path, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+        return text
+
+    with patch("repo2string.scan.read_text", side_effect=read_then_write):
+        store = FileStore.from_files(str(repo), iter_included_files(str(repo), with_mtime=True))
+    try:
+        ids = {store.rel_path(i): i for i in range(len(store))}
+        assert store.text(ids["a.py"]) == "print('a')"
+        assert store.is_modified(ids["a.py"])
+        assert not store.is_modified(ids["empty.txt"])
+    finally:
+        store.close()
+
+
+def test_close_on_scan_error(tmp_path):
+    """A store whose scan fails is closed instead of leaking its temporary file."""
+
+    def failing_files():
+        yield str(tmp_path / "a.py"), "a.py", "print('a')", 1, 0
+        raise OSError("scan failed")
+
+    closed = []
+    original_close = FileStore.close
+
+    def tracking_close(self):
+        closed.append(self)
+        original_close(self)
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(FileStore, "close", tracking_close)
+        with pytest.raises(OSError):
+            FileStore.from_files(str(tmp_path), failing_files())
+    assert len(closed) == 1
+
+
+PEAK_RSS_SCRIPT = """
+import sys
+
+from repo2string.file_store import FileStore
+from repo2string.scan import get_included_files, iter_included_files
+
+
+def peak_rss_kib():
+    # VmHWM is reset on exec, unlike ru_maxrss which Linux carries over from the parent
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+if sys.argv[2] == "list":
+    files = get_included_files(sys.argv[1])
+else:
+    files = FileStore.from_files(sys.argv[1], iter_included_files(sys.argv[1], with_mtime=True))
+print(peak_rss_kib())
+"""
+
+
+def _peak_rss(path, mode):
+    result = subprocess.run(
+        [sys.executable, "-c", PEAK_RSS_SCRIPT, str(path), mode],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return int(result.stdout.strip())
+
+
+@pytest.mark.skipif(
+    not os.environ.get("REPO2STRING_BENCHMARK"),
+    reason="benchmark; set REPO2STRING_BENCHMARK=1 to run",
+)
+def test_peak_rss_benchmark(tmp_path):
+    """Benchmark: peak RSS of keeping every file's text vs. the compact store."""
+    pytest.importorskip("resource")
+    # ~21 MiB of non-ASCII UTF-8 text, held as 2 bytes per character in Python strings
+    line = "zażółć gęślą jaźń " * 8 + "\n"
+    for i in range(64):
+        (tmp_path / f"file_{i}.txt").write_text(line * 1600, encoding="utf-8")
+    content_size = sum(f.stat().st_size for f in tmp_path.iterdir())
+
+    list_rss = _peak_rss(tmp_path, "list") * 1024
+    store_rss = _peak_rss(tmp_path, "store") * 1024
+    assert list_rss - store_rss > content_size / 2, (
+        f"peak RSS: {list_rss} bytes with str list, {store_rss} bytes with FileStore, "
+        f"for {content_size} bytes of text"
+    )
@@ -0,0 +1,192 @@
+import gc
+import random
+
+import pytest
+
+from repo2string.tree_index import DirectoryIndex
+
+
+@pytest.fixture
+def index():
+    return DirectoryIndex.from_files(
+        [
+            ("a/b/c.py", 10, 100),
+            ("a/b/d.py", 20, 200),
+            ("a/e.py", 30, 300),
+            ("f.py", 40, 400),
+        ]
+    )
+
+
+def totals(summary):
+    return summary["files"], summary["tokens"], summary["bytes"]
+
+
+def selected(summary):
+    s = summary["selected"]
+    return s["files"], s["tokens"], s["bytes"]
+
+
+def test_aggregates(index):
+    """Every folder holds the totals of its subtree, all selected initially."""
+    selection = index.selection()
+    assert totals(selection.summary()) == (4, 100, 1000)
+    assert totals(selection.summary("a")) == (3, 60, 600)
+    assert totals(selection.summary("a/b")) == (2, 30, 300)
+    assert selected(selection.summary("a/b")) == (2, 30, 300)
+    assert totals(selection.summary("f.py")) == (1, 40, 400)
+    # Nothing is stored for a fresh selection
+    assert selection._overlay == {}
+
+
+def test_select_file_and_folder(index):
+    """Selection changes update the node, its subtree and its ancestors."""
+    selection = index.selection()
+    selection.set_selected("a/b/c.py", False)
+    assert selected(selection.summary("a/b")) == (1, 20, 200)
+    assert selected(selection.summary()) == (3, 90, 900)
+
+    selection.set_selected("a", False)
+    assert selected(selection.summary("a/b/d.py")) == (0, 0, 0)
+    assert selected(selection.summary()) == (1, 40, 400)
+
+    selection.set_selected("a/b", True)
+    assert selected(selection.summary("a")) == (2, 30, 300)
+    assert [a["path"] for a in selection.ancestors("a/b")] == ["", "a"]
+    with pytest.raises(KeyError):
+        selection.summary("missing")
+
+    selection.set_selected("", True)
+    assert selection._overlay == {}
+
+
+def test_selections_are_independent(index):
+    """Each selection has its own selected counts over the shared totals."""
+    first, second = index.selection(), index.selection()
+    first.set_selected("a", False)
+    assert selected(first.summary()) == (1, 40, 400)
+    assert selected(second.summary()) == (4, 100, 1000)
+
+    del second
+    gc.collect()
+    assert len(index._selections) == 1
+
+
+def test_folder(index):
+    """A folder's summary lists its direct children with their selected counts."""
+    selection = index.selection()
+    selection.set_selected("a/b/c.py", False)
+    folder = selection.folder("a")
+    assert selected(folder) == (2, 50, 500)
+    assert {child["path"]: selected(child) for child in folder["children"]} == {
+        "a/b": (1, 20, 200),
+        "a/e.py": (1, 30, 300),
+    }
+    assert "children" not in selection.folder("f.py")
+    with pytest.raises(KeyError):
+        selection.folder("a/missing")
+
+
+def test_add_update_remove(index):
+    """Files can change after the index is built; totals and selections follow."""
+    selection = index.selection()
+    selection.set_selected("a/b", False)
+
+    # Updated files keep their selection state
+    index.add_file("a/b/c.py", 15, 150)
+    index.add_file("a/e.py", 35, 350)
+    assert totals(selection.summary("a")) == (3, 70, 700)
+    assert selected(selection.summary("a")) == (1, 35, 350)
+
+    # New files follow their folder: unselected in a/b, selected elsewhere
+    index.add_file("a/b/new.py", 5, 50)
+    index.add_file("g/h/new.py", 1, 10)
+    assert selected(selection.summary("a/b/new.py")) == (0, 0, 0)
+    assert selected(selection.summary("g")) == (1, 1, 10)
+    assert totals(selection.summary()) == (6, 116, 1160)
+    assert selected(selection.summary()) == (3, 76, 760)
+
+    # Removing files prunes empty folders
+    index.remove_file("g/h/new.py")
+    index.remove_file("a/e.py")
+    with pytest.raises(KeyError):
+        selection.summary("g")
+    assert totals(selection.summary("a")) == (3, 40, 400)
+    assert selected(selection.summary()) == (1, 40, 400)
+
+    with pytest.raises(KeyError):
+        index.remove_file("a")
+    with pytest.raises(ValueError):
+        index.add_file("f.py/x.py", 1, 1)
+    with pytest.raises(ValueError):
+        index.add_file("a/b", 1, 1)
+
+
+def test_memory_usage(index):
+    """The index reports its node count and size."""
+    usage = index.memory_usage()
+    assert usage["nodes"] == 7
+    assert usage["bytes"] > 0
+
+
+def test_random_changes_match_recount():
+    """After random selections and file changes, every folder matches a full recount."""
+    rng = random.Random(0)
+    names = [f"{d}/{f}.py" for d in ("x", "x/y", "x/y/z", "w") for f in "abcd"]
+    index = DirectoryIndex()
+    selections = [index.selection(), index.selection()]
+    # rel_path -> [tokens, bytes]; (selection number, rel_path) for selected files
+    files = {}
+    chosen = set()
+
+    def under(folder):
+        return [p for p in files if not folder or p.startswith(folder + "/")]
+
+    def expected_selected(number, rel_path):
+        # New files follow the deepest folder that already exists
+        parts = rel_path.split("/")[:-1]
+        folders = ["/".join(parts[:i]) for i in range(len(parts), -1, -1)]
+        inside = next(under(f) for f in folders if under(f) or not f)
+        return not inside or any((number, p) in chosen for p in inside)
+
+    for _ in range(500):
+        rel_path = rng.choice(names)
+        op = rng.random()
+        if op < 0.4:
+            tokens = rng.randrange(100)
+            if rel_path not in files:
+                for number in range(len(selections)):
+                    if expected_selected(number, rel_path):
+                        chosen.add((number, rel_path))
+            files[rel_path] = [tokens, tokens * 10]
+            index.add_file(rel_path, tokens, tokens * 10)
+        elif op < 0.6 and rel_path in files:
+            del files[rel_path]
+            chosen -= {(number, rel_path) for number in range(len(selections))}
+            index.remove_file(rel_path)
+        elif files:
+            number = rng.randrange(len(selections))
+            path = rng.choice(["", "x", "x/y", "w"] + list(files))
+            is_selected = rng.random() < 0.5
+            try:
+                selections[number].set_selected(path, is_selected)
+            except KeyError:
+                continue
+            for p in [path] if path in files else under(path):
+                if is_selected:
+                    chosen.add((number, p))
+                else:
+                    chosen.discard((number, p))
+
+        for folder in ("", "x", "x/y", "x/y/z", "w"):
+            inside = under(folder)
+            for number, selection in enumerate(selections):
+                try:
+                    summary = selection.summary(folder)
+                except KeyError:
+                    assert not inside
+                    continue
+                expected = (len(inside), sum(files[p][0] for p in inside))
+                assert (summary["files"], summary["tokens"]) == expected
+                picked = [p for p in inside if (number, p) in chosen]
+                assert selected(summary)[:2] == (len(picked), sum(files[p][0] for p in picked))
@@ -1,9 +1,22 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 
 from repo2string.scan import get_included_files
-from repo2string.ui_server import create_app
+from repo2string.ui_server import (
+    QuietWSGIRequestHandler,
+    ThreadingWSGIServer,
+    create_app,
+    make_server,
+)
 
 
 @pytest.fixture
@@ -15,6 +28,7 @@ def app():
         }
     )
     yield app
+    app.config["FILE_STORE"].close()
 
 
 @pytest.fixture
@@ -46,17 +60,18 @@ def test_api_files_route(client):
     data = response.get_json()
     assert "files" in data
     assert "basePath" in data
-    assert isinstance(data["files"], list)
+    assert "rootPath" in data
+    # Files are sent as columns
+    files = data["files"]
+    assert set(files) == {"relPath", "tokens"}
+    assert len(files["relPath"]) == len(files["tokens"])
     # Verify some expected files are present
-    files_str = str(data["files"]).lower()  # Case-insensitive comparison
+    files_str = str(files["relPath"]).lower()  # Case-insensitive comparison
     assert "pyproject.toml" in files_str
     assert "readme.md" in files_str
-    # Verify file structure
-    for file_info in data["files"]:
-        assert "relPath" in file_info
-        assert "absPath" in file_info
-        assert "tokens" in file_info
-        assert isinstance(file_info["tokens"], int)
+    assert all(isinstance(tokens, int) for tokens in files["tokens"])
+    # Absolute paths are not repeated per file
+    assert data["rootPath"] not in str(files)
 
 
 def test_api_submit(mock_pyperclip, client):
@@ -75,6 +90,25 @@ def test_api_submit(mock_pyperclip, client):
     mock_pyperclip.copy.assert_called_once()
 
 
+def test_api_submit_reports_modified_files(mock_pyperclip, tmp_path, capsys):
+    """Files changed on disk after the UI opened are reported on submit."""
+    (tmp_path / "a.py").write_text("print('a')")
+    (tmp_path / "b.py").write_text("print('b')")
+    app = create_app(str(tmp_path))
+    app.config.update({"TESTING": True})
+    try:
+        (tmp_path / "a.py").write_text("print('changed a')")
+        os.utime(tmp_path / "a.py", ns=(0, 0))
+        response = app.test_client().post("/api/submit", json={"include": ["a.py", "b.py"]})
+    finally:
+        app.config["FILE_STORE"].close()
+
+    assert response.get_json()["modified"] == ["a.py"]
+    assert "a.py" in capsys.readouterr().err
+    # The version shown in the UI is what gets copied
+    assert "print('a')" in mock_pyperclip.copy.call_args[0][0]
+
+
 def test_error_handling(client):
     """Test error handling for invalid requests."""
     # Test invalid JSON
@@ -92,3 +126,201 @@ def test_error_handling(client):
     assert response.status_code == 200  # Should handle gracefully
     data = response.get_json()
     assert data["total_tokens"] == 0
+
+
+def test_api_session(client):
+    """A session starts with everything selected and aggregated at the root."""
+    data = client.post("/api/session").get_json()
+    assert isinstance(data["session"], str)
+    total = data["total"]
+    assert total["files"] == len(get_included_files("."))
+    assert total["selected"]["tokens"] == total["tokens"]
+
+
+def test_api_select(client):
+    """Selecting folders updates that session's totals only."""
+    session = client.post("/api/session").get_json()["session"]
+    other = client.post("/api/session").get_json()["session"]
+
+    response = client.post("/api/select", json={"session": session, "path": "", "selected": False})
+    assert response.get_json()["total"]["selected"]["files"] == 0
+
+    response = client.post(
+        "/api/select", json={"session": session, "path": "repo2string", "selected": True}
+    )
+    data = response.get_json()
+    assert [folder["path"] for folder in data["ancestors"]] == [""]
+    assert data["node"]["selected"] == data["total"]["selected"]
+    assert data["node"]["selected"]["files"] == data["node"]["files"]
+
+    # Another page's selection is untouched
+    response = client.post(
+        "/api/select", json={"session": other, "path": "tests", "selected": True}
+    )
+    other_total = response.get_json()["total"]
+    assert other_total["selected"]["files"] == other_total["files"]
+
+    unknown_path = {"session": session, "path": "x", "selected": True}
+    assert client.post("/api/select", json=unknown_path).status_code == 404
+    unknown_session = {"session": "nope", "path": "", "selected": True}
+    assert client.post("/api/select", json=unknown_session).status_code == 404
+    missing_field = {"session": session, "path": ""}
+    assert client.post("/api/select", json=missing_field).status_code == 400
+
+
+def test_api_session_reuses_index(app, client):
+    """Sessions are overlays on the index built at startup, not copies of it."""
+    with patch("repo2string.ui_server.DirectoryIndex.from_files") as mock_build:
+        for _ in range(3):
+            client.post("/api/session")
+    assert not mock_build.called
+    index = app.config["DIRECTORY_INDEX"]
+    assert all(s.index is index for s in app.config["SELECTION_SESSIONS"].values())
+
+
+def test_api_folder(client):
+    """A folder's totals, selected totals and direct children, per session."""
+    session = client.post("/api/session").get_json()["session"]
+    client.post("/api/select", json={"session": session, "path": "tests", "selected": False})
+
+    data = client.get("/api/folder", query_string={"session": session}).get_json()
+    children = {child["path"]: child for child in data["children"]}
+    assert data["files"] == sum(child["files"] for child in children.values())
+    assert children["tests"]["selected"]["files"] == 0
+    assert children["repo2string"]["type"] == "folder"
+    assert data["selected"]["files"] == data["files"] - children["tests"]["files"]
+
+    data = client.get(
+        "/api/folder", query_string={"session": session, "path": "repo2string"}
+    ).get_json()
+    assert {child["name"] for child in data["children"]} >= {"cli.py", "ui_server.py"}
+    assert data["selected"]["files"] == data["files"]
+
+    query = {"session": session, "path": "missing"}
+    assert client.get("/api/folder", query_string=query).status_code == 404
+    assert client.get("/api/folder", query_string={"session": "nope"}).status_code == 404
+    assert client.get("/api/folder").status_code == 400
+
+
+def test_api_files_etag(client):
+    """The file list carries an ETag and answers 304 when it matches."""
+    response = client.get("/api/files")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    response = client.get("/api/files", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    response = client.get("/api/files", headers={"If-None-Match": '"stale"'})
+    assert response.status_code == 200
+
+
+def test_etag_computed_once(client):
+    """The file list is hashed once, not on every (conditional) request."""
+    with patch("repo2string.ui_server.hashlib.sha1", wraps=hashlib.sha1) as mock_sha1:
+        etag = client.get("/api/files").headers["ETag"]
+        client.get("/api/files", headers={"If-None-Match": etag})
+        client.get("/api/files")
+    assert mock_sha1.call_count == 1
+
+
+def test_index_route_etag(client):
+    """ui.html is served from memory with an ETag."""
+    etag = client.get("/").headers["ETag"]
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+
+@pytest.fixture
+def large_tree(tmp_path):
+    """A repository with a few thousand files spread over nested folders."""
+    for i in range(50):
+        folder = tmp_path / f"pkg{i}" / "sub"
+        folder.mkdir(parents=True)
+        for j in range(60):
+            (folder / f"module_{j}.py").write_text(f"def f{j}():\n    return {i * j}\n")
+    return tmp_path
+
+
+@pytest.fixture
+def large_client(large_tree):
+    app = create_app(str(large_tree))
+    yield app.test_client()
+    app.config["FILE_STORE"].close()
+
+
+def test_gzip_compression(large_client):
+    """Large responses are gzip-compressed when the client accepts it."""
+    plain = large_client.get("/api/files")
+    assert "Content-Encoding" not in plain.headers
+
+    response = large_client.get("/api/files", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data) == plain.data
+    # The same ETag is valid for the compressed variant
+    assert response.headers["ETag"] == plain.headers["ETag"]
+
+
+def test_brotli_compression(large_client):
+    """Brotli is preferred when it is installed and accepted."""
+    brotli = pytest.importorskip("brotli")
+    plain = large_client.get("/api/files")
+    response = large_client.get("/api/files", headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert brotli.decompress(response.data) == plain.data
+
+
+def test_small_responses_not_compressed(client):
+    """Small API responses are sent as-is."""
+    response = client.post("/api/submit", json={"include": []}, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_api_files_large_tree(large_client, large_tree):
+    """The columnar payload stays compact and compresses well on large trees."""
+    response = large_client.get("/api/files", headers={"Accept-Encoding": "gzip"})
+    data = json.loads(gzip.decompress(response.data))
+
+    assert len(data["files"]["relPath"]) == 3000
+    assert str(large_tree) not in json.dumps(data["files"])
+    assert len(response.data) < len(gzip.decompress(response.data)) / 4
+
+
+def test_concurrent_clients(large_tree):
+    """The threaded WSGI server serves many concurrent clients consistently."""
+    app = create_app(str(large_tree))
+    app.config.update({"TESTING": True})
+    server = make_server(
+        "127.0.0.1",
+        0,
+        app,
+        server_class=ThreadingWSGIServer,
+        handler_class=QuietWSGIRequestHandler,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    def fetch(i):
+        path = "/api/files" if i % 2 else "/"
+        req = urllib.request.Request(url + path, headers={"Accept-Encoding": "gzip"})
+        with urllib.request.urlopen(req, timeout=10) as res:
+            return path, res.status, res.headers["ETag"], gzip.decompress(res.read())
+
+    try:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(fetch, range(64)))
+    finally:
+        server.shutdown()
+        server.server_close()
+        app.config["FILE_STORE"].close()
+
+    assert all(status == 200 for _, status, _, _ in results)
+    for path in ("/", "/api/files"):
+        bodies = {(etag, body) for p, _, etag, body in results if p == path}
+        assert len(bodies) == 1
+    files = json.loads(next(body for p, _, _, body in results if p == "/api/files"))
+    assert len(files["files"]["relPath"]) == 3000
+    assert Path(files["rootPath"]) == large_tree